@@ -0,0 +1,214 @@
+import http
+import json
+import time
+
+
+class NodeMetricsSource(object):
+    def __init__(self, deployer, port=5000, timeout=5):
+        self.deployer = deployer
+        self.port = port
+        self.timeout = timeout
+
+    def get_metrics(self):
+        # unreachable nodes are kept as None, they are still part of the fleet
+        result = {}
+        for instance_id, public_ip_address in self.deployer.get_fleet():
+            result[instance_id] = None
+            try:
+                http_con = http.client.HTTPConnection(
+                    public_ip_address, self.port, timeout=self.timeout
+                )
+                http_con.request("GET", "/internal/stats")
+                response = http_con.getresponse()
+                if response.status != 200:
+                    continue
+                stats = json.loads(response.read().decode())
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                print(f"Could not read metrics of {instance_id}: {e}")
+                continue
+            stats["public_ip_address"] = public_ip_address
+            result[instance_id] = stats
+        return result
+
+
+class ScalingPolicy(object):
+    def __init__(
+        self,
+        min_nodes=2,
+        max_nodes=10,
+        scale_out_cpu=0.75,
+        scale_in_cpu=0.25,
+        scale_out_memory=80.0,
+        scale_in_memory=40.0,
+        breach_periods=3,
+        cooldown=300,
+        scale_out_step=1,
+    ):
+        assert scale_in_cpu < scale_out_cpu, "cpu thresholds must leave a dead band"
+        assert (
+            scale_in_memory < scale_out_memory
+        ), "memory thresholds must leave a dead band"
+        self.min_nodes = min_nodes
+        self.max_nodes = max_nodes
+        self.scale_out_cpu = scale_out_cpu
+        self.scale_in_cpu = scale_in_cpu
+        self.scale_out_memory = scale_out_memory
+        self.scale_in_memory = scale_in_memory
+        self.breach_periods = breach_periods
+        self.cooldown = cooldown
+        self.scale_out_step = scale_out_step
+
+    def wants_scale_out(self, metrics):
+        cpu = sum(m["cpu_load"] for m in metrics.values()) / len(metrics)
+        memory = max(m["memory_percent"] for m in metrics.values())
+        return cpu > self.scale_out_cpu or memory > self.scale_out_memory
+
+    def wants_scale_in(self, metrics, nodes_count):
+        cpu = sum(m["cpu_load"] for m in metrics.values()) / len(metrics)
+        memory = max(m["memory_percent"] for m in metrics.values())
+        # the remaining nodes take over the retired node's share, don't retire a node
+        # if that would push them straight back over the scale-out thresholds
+        projected = nodes_count / (nodes_count - 1)
+        return (
+            cpu < self.scale_in_cpu
+            and memory < self.scale_in_memory
+            and cpu * projected <= self.scale_out_cpu
+            and memory * projected <= self.scale_out_memory
+        )
+
+
+class AutoscalingController(object):
+    SCALE_OUT = "scale_out"
+    SCALE_IN = "scale_in"
+
+    def __init__(self, deployer, metrics_source, policy=None, clock=time.time):
+        self.deployer = deployer
+        self.metrics_source = metrics_source
+        self.policy = policy or ScalingPolicy()
+        self.clock = clock
+        self.last_action_at = None
+        self._scale_out_streak = 0
+        self._scale_in_streak = 0
+
+    def in_cooldown(self):
+        if self.last_action_at is None:
+            return False
+        return self.clock() - self.last_action_at < self.policy.cooldown
+
+    def pick_node_to_retire(self, metrics):
+        # the node holding the fewest keys is the cheapest one to hand off
+        return min(
+            metrics, key=lambda instance_id: metrics[instance_id]["keys_in_memory"]
+        )
+
+    def decide(self, metrics):
+        policy = self.policy
+        # unreachable nodes count towards the fleet size but not towards the load
+        nodes_count = len(metrics)
+        metrics = {
+            instance_id: stats
+            for instance_id, stats in metrics.items()
+            if stats is not None
+        }
+        if not metrics:
+            return None
+
+        if self.in_cooldown():
+            # samples taken while the ring is still rebalancing say nothing about the
+            # steady state, so they don't count towards a breach
+            self._scale_out_streak = 0
+            self._scale_in_streak = 0
+            return None
+
+        if policy.wants_scale_out(metrics):
+            self._scale_out_streak += 1
+            self._scale_in_streak = 0
+        elif nodes_count > 1 and policy.wants_scale_in(metrics, nodes_count):
+            self._scale_in_streak += 1
+            self._scale_out_streak = 0
+        else:
+            self._scale_out_streak = 0
+            self._scale_in_streak = 0
+
+        if self._scale_out_streak >= policy.breach_periods:
+            count = min(policy.scale_out_step, policy.max_nodes - nodes_count)
+            if count > 0:
+                return self.SCALE_OUT, count
+        if self._scale_in_streak >= policy.breach_periods:
+            if nodes_count > policy.min_nodes:
+                return self.SCALE_IN, self.pick_node_to_retire(metrics)
+        return None
+
+    def step(self, dry_run=False):
+        metrics = self.metrics_source.get_metrics()
+        decision = self.decide(metrics)
+        if decision is None:
+            return None
+
+        action, target = decision
+        reachable = sum(stats is not None for stats in metrics.values())
+        print(
+            f"Autoscaler decision: {action} {target} "
+            f"({reachable}/{len(metrics)} nodes reachable)"
+        )
+        if dry_run:
+            return decision
+
+        try:
+            if action == self.SCALE_OUT:
+                self.deployer.add_instances_to_existing_deployment(count=target)
+            else:
+                self.deployer.retire_instance(
+                    instance_id=target,
+                    public_ip_address=metrics[target]["public_ip_address"],
+                )
+        finally:
+            # a failed action may still have changed the fleet, cool down either way
+            self.last_action_at = self.clock()
+            self._scale_out_streak = 0
+            self._scale_in_streak = 0
+        return decision
+
+    def run(self, interval=60, dry_run=False):
+        while True:
+            try:
+                self.step(dry_run=dry_run)
+            except Exception as e:
+                print(f"Autoscaler step failed: {e}")
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    from deployment import CacheAppDeployer
+
+    parser = ArgumentParser("HW2_AUTOSCALER")
+
+    parser.add_argument("--run_id", help="run id of the deployment", required=True)
+    parser.add_argument("--interval", type=int, default=60)
+    parser.add_argument("--min_nodes", type=int, default=2)
+    parser.add_argument("--max_nodes", type=int, default=10)
+    parser.add_argument("--cooldown", type=int, default=300)
+    parser.add_argument("--breach_periods", type=int, default=3)
+    parser.add_argument(
+        "--dry_run",
+        help="only print scaling decisions",
+        action="store_true",
+        default=False,
+    )
+
+    args = parser.parse_args()
+
+    deployer = CacheAppDeployer(run_id=args.run_id)
+    controller = AutoscalingController(
+        deployer=deployer,
+        metrics_source=NodeMetricsSource(deployer),
+        policy=ScalingPolicy(
+            min_nodes=args.min_nodes,
+            max_nodes=args.max_nodes,
+            cooldown=args.cooldown,
+            breach_periods=args.breach_periods,
+        ),
+    )
+    controller.run(interval=args.interval, dry_run=args.dry_run)
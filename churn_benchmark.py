@@ -0,0 +1,477 @@
+import datetime
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from boto3 import Session
+from redis import StrictRedis
+
+APP_PORT = 5000
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server")
+
+sys.path.insert(0, SERVER_DIR)
+from store_layout import ShardedStore, all_shards
+
+
+class LocalCacheCluster(object):
+    def __init__(
+        self,
+        redis_address,
+        s3_bucket,
+        s3_endpoint=None,
+        heartbeat_timeout=10,
+        health_check_interval=1,
+        unhealthy_grace=10,
+        startup_timeout=600,
+    ):
+        self.redis_address = redis_address
+        self.s3_bucket = s3_bucket
+        self.s3_endpoint = s3_endpoint
+        self.heartbeat_timeout = heartbeat_timeout
+        self.health_check_interval = health_check_interval
+        self.unhealthy_grace = unhealthy_grace
+        self.startup_timeout = startup_timeout
+        self.processes = {}
+        self.paused = set()
+        self.killed = {}
+        self._next_ip = 2
+        self._stopped = threading.Event()
+        self._health_thread = None
+
+    @property
+    def live_nodes(self):
+        return [ip for ip in self.processes if ip not in self.paused]
+
+    @property
+    def routable_nodes(self):
+        # an ELB keeps routing to a dead target until its health checks fail, so killed
+        # nodes stay in the routing set for a grace period, like paused ones do
+        now = time.time()
+        killed = [
+            ip
+            for ip, killed_at in self.killed.items()
+            if now - killed_at < self.unhealthy_grace
+        ]
+        return list(self.processes) + killed
+
+    def _allocate_ip(self):
+        ip = f"127.0.0.{self._next_ip}"
+        self._next_ip += 1
+        return ip
+
+    def start_node(self, wait=True):
+        ip = self._allocate_ip()
+        env = dict(os.environ)
+        env.update(
+            {
+                "REDIS_ADDRESS": self.redis_address,
+                "STORE_BUCKET": self.s3_bucket,
+                "NODE_IP": ip,
+                "BIND_ADDRESS": ip,
+                "HEARTBEAT_TIMEOUT": str(self.heartbeat_timeout),
+            }
+        )
+        if self.s3_endpoint:
+            env["AWS_ENDPOINT_URL"] = self.s3_endpoint
+
+        self.processes[ip] = subprocess.Popen(
+            [sys.executable, "main.py"],
+            cwd=SERVER_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        print(f"Started node {ip} (pid {self.processes[ip].pid})")
+        if wait:
+            self.wait_until_healthy(ip)
+        return ip
+
+    def wait_until_healthy(self, ip, timeout=None):
+        # a node only turns healthy after its first full refresh_cache
+        timeout = self.startup_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if requests.get(f"http://{ip}:{APP_PORT}/health", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise TimeoutError(f"Node {ip} did not become healthy within {timeout}s")
+
+    def kill_node(self, ip):
+        process = self.processes.pop(ip)
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+        self.paused.discard(ip)
+        self.killed[ip] = time.time()
+        print(f"Killed node {ip}")
+
+    def pause_node(self, ip):
+        self.processes[ip].send_signal(signal.SIGSTOP)
+        self.paused.add(ip)
+        print(f"Paused node {ip}")
+
+    def resume_node(self, ip):
+        self.processes[ip].send_signal(signal.SIGCONT)
+        self.paused.discard(ip)
+        print(f"Resumed node {ip}")
+
+    def _health_check_loop(self):
+        # stands in for the ELB health check, which is what drives node heartbeats
+        while not self._stopped.is_set():
+            for ip in self.live_nodes:
+                try:
+                    requests.get(f"http://{ip}:{APP_PORT}/health", timeout=1)
+                except requests.RequestException:
+                    pass
+            self._stopped.wait(self.health_check_interval)
+
+    def start_health_checks(self):
+        self._health_thread = threading.Thread(
+            target=self._health_check_loop, daemon=True
+        )
+        self._health_thread.start()
+
+    def get_node_stats(self, ip):
+        try:
+            response = requests.get(f"http://{ip}:{APP_PORT}/internal/stats", timeout=2)
+            return response.json() if response.ok else None
+        except requests.RequestException:
+            return None
+
+    def stop(self):
+        self._stopped.set()
+        for ip in list(self.processes):
+            if ip in self.paused:
+                self.resume_node(ip)
+            process = self.processes.pop(ip)
+            process.terminate()
+            process.wait()
+
+
+class LoadGenerator(object):
+    def __init__(self, cluster, keys, concurrency=8, request_timeout=1):
+        self.cluster = cluster
+        self.keys = keys
+        self.concurrency = concurrency
+        self.request_timeout = request_timeout
+        self.samples = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def _worker(self):
+        http = requests.Session()
+        while not self._stopped.is_set():
+            # every registered node gets traffic, paused and freshly killed ones
+            # included, like an ELB that has not yet marked them unhealthy
+            nodes = self.cluster.routable_nodes
+            if not nodes:
+                time.sleep(0.1)
+                continue
+            ip = random.choice(nodes)
+            key = random.choice(self.keys)
+            outcome = "hit"
+            try:
+                response = http.get(
+                    f"http://{ip}:{APP_PORT}/keys/{key}", timeout=self.request_timeout
+                )
+                if not response.ok:
+                    outcome = "error"
+                elif response.json() is None:
+                    outcome = "miss"
+            except requests.RequestException:
+                outcome = "error"
+            with self._lock:
+                self.samples.append((time.time(), outcome))
+
+    def start(self):
+        for _ in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+
+    def timeline(self, start, end, bucket_seconds=1):
+        with self._lock:
+            samples = [s for s in self.samples if start <= s[0] < end]
+
+        buckets = {}
+        for timestamp, outcome in samples:
+            offset = int((timestamp - start) // bucket_seconds) * bucket_seconds
+            bucket = buckets.setdefault(offset, {"hit": 0, "miss": 0, "error": 0})
+            bucket[outcome] += 1
+
+        result = []
+        for offset in sorted(buckets):
+            bucket = buckets[offset]
+            total = sum(bucket.values())
+            result.append(
+                {
+                    "t": offset,
+                    "requests": total,
+                    "miss_rate": bucket["miss"] / total,
+                    "error_rate": bucket["error"] / total,
+                }
+            )
+        return result
+
+
+class ChurnBenchmark(object):
+    STAT_COUNTERS = [
+        "s3_list_requests",
+        "s3_get_requests",
+        "s3_put_requests",
+        "s3_delete_requests",
+        "s3_bytes_loaded",
+        "refresh_count",
+    ]
+
+    def __init__(
+        self,
+        redis_address="localhost",
+        s3_bucket="churn-benchmark-store",
+        s3_endpoint=None,
+        initial_nodes=3,
+        heartbeat_timeout=10,
+        value_size=1024,
+        concurrency=8,
+        convergence_timeout=900,
+        settle_seconds=10,
+        unhealthy_grace=10,
+        startup_timeout=3600,
+    ):
+        self.redis_address = redis_address
+        self.s3_bucket = s3_bucket
+        self.s3_endpoint = s3_endpoint
+        self.initial_nodes = initial_nodes
+        self.heartbeat_timeout = heartbeat_timeout
+        self.value_size = value_size
+        self.concurrency = concurrency
+        self.convergence_timeout = convergence_timeout
+        self.settle_seconds = settle_seconds
+        self.unhealthy_grace = unhealthy_grace
+        self.startup_timeout = startup_timeout
+        self.s3_client = Session().client("s3", endpoint_url=s3_endpoint)
+
+    def reset_state(self):
+        redis_client = StrictRedis(host=self.redis_address)
+        for node_key in redis_client.keys(pattern="node_*"):
+            redis_client.delete(node_key)
+
+        try:
+            self.s3_client.create_bucket(Bucket=self.s3_bucket)
+        except self.s3_client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.s3_bucket):
+            objects = [{"Key": record["Key"]} for record in page.get("Contents", [])]
+            if objects:
+                self.s3_client.delete_objects(
+                    Bucket=self.s3_bucket, Delete={"Objects": objects}
+                )
+
+    def seed_keys(self, key_count):
+        keys = [f"session_{i}" for i in range(key_count)]
+        value = {"payload": "x" * self.value_size}
+        expiration_date = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        store = ShardedStore(s3_client=self.s3_client, bucket=self.s3_bucket)
+
+        def put(key):
+            store.put(key=key, value=value, expiration_date=expiration_date)
+
+        print(f"Seeding {key_count} keys into {self.s3_bucket}...")
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            list(executor.map(put, keys))
+            # nodes start from compacted manifests, as they would in a long-running bucket
+            list(executor.map(store.compact_shard, all_shards()))
+        return keys
+
+    def collect_stats(self, cluster, nodes):
+        result = {}
+        for ip in nodes:
+            stats = cluster.get_node_stats(ip)
+            if stats is not None:
+                result[ip] = stats
+        return result
+
+    def wait_for_convergence(self, cluster, since):
+        expected = sorted(cluster.live_nodes)
+        deadline = time.time() + self.convergence_timeout
+        while time.time() < deadline:
+            stats = self.collect_stats(cluster, expected)
+            if len(stats) == len(expected) and all(
+                sorted(node_stats["live_nodes"]) == expected
+                and (node_stats["last_refresh_finished"] or 0) >= since
+                for node_stats in stats.values()
+            ):
+                return time.time() - since
+            time.sleep(0.5)
+        return None
+
+    def _counter_deltas(self, before, after):
+        result = {counter: 0 for counter in self.STAT_COUNTERS}
+        for ip, node_stats in after.items():
+            previous = before.get(ip, {})
+            for counter in self.STAT_COUNTERS:
+                result[counter] += node_stats[counter] - previous.get(counter, 0)
+        return result
+
+    def run_transition(self, cluster, load, name, action):
+        survivors_before = self.collect_stats(cluster, cluster.live_nodes)
+        started = time.time()
+        action()
+        convergence_seconds = self.wait_for_convergence(cluster, since=started)
+        time.sleep(self.settle_seconds)
+        finished = time.time()
+
+        stats_after = self.collect_stats(cluster, cluster.live_nodes)
+        timeline = load.timeline(started, finished)
+        total = sum(bucket["requests"] for bucket in timeline) or 1
+        result = {
+            "scenario": name,
+            "convergence_seconds": convergence_seconds,
+            "live_nodes": len(cluster.live_nodes),
+            "keys_in_memory": sum(s["keys_in_memory"] for s in stats_after.values()),
+            "miss_rate": sum(b["miss_rate"] * b["requests"] for b in timeline) / total,
+            "error_rate": sum(b["error_rate"] * b["requests"] for b in timeline)
+            / total,
+            "timeline": timeline,
+        }
+        result.update(self._counter_deltas(survivors_before, stats_after))
+        print(
+            f"[{name}] converged in {convergence_seconds}s ; "
+            f"S3 GETs: {result['s3_get_requests']} ; bytes moved: {result['s3_bytes_loaded']} ; "
+            f"miss rate: {result['miss_rate']:.3f} ; error rate: {result['error_rate']:.3f}"
+        )
+        return result
+
+    def run(self, key_count):
+        self.reset_state()
+        keys = self.seed_keys(key_count)
+
+        cluster = LocalCacheCluster(
+            redis_address=self.redis_address,
+            s3_bucket=self.s3_bucket,
+            s3_endpoint=self.s3_endpoint,
+            heartbeat_timeout=self.heartbeat_timeout,
+            unhealthy_grace=self.unhealthy_grace,
+            startup_timeout=self.startup_timeout,
+        )
+        load = LoadGenerator(cluster, keys, concurrency=self.concurrency)
+        results = []
+        try:
+            cluster.start_health_checks()
+            for _ in range(self.initial_nodes):
+                cluster.start_node()
+            if self.wait_for_convergence(cluster, since=0) is None:
+                raise TimeoutError(
+                    f"initial ring did not converge within {self.convergence_timeout}s"
+                )
+            load.start()
+
+            victim = cluster.live_nodes[0]
+            results.append(
+                self.run_transition(
+                    cluster, load, "kill", lambda: cluster.kill_node(victim)
+                )
+            )
+            paused = cluster.live_nodes[0]
+            results.append(
+                self.run_transition(
+                    cluster, load, "pause", lambda: cluster.pause_node(paused)
+                )
+            )
+            results.append(
+                self.run_transition(
+                    cluster, load, "resume", lambda: cluster.resume_node(paused)
+                )
+            )
+            results.append(
+                self.run_transition(cluster, load, "add", cluster.start_node)
+            )
+        except TimeoutError as e:
+            # keep what was measured so far, the remaining key counts still run
+            print(f"Run with {key_count} keys aborted: {e}")
+            return {"keys": key_count, "scenarios": results, "error": str(e)}
+        finally:
+            load.stop()
+            cluster.stop()
+
+        return {"keys": key_count, "scenarios": results}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser("HW2_CHURN_BENCHMARK")
+
+    parser.add_argument(
+        "--keys",
+        help="key counts to benchmark",
+        type=int,
+        nargs="+",
+        default=[10000, 100000, 1000000],
+    )
+    parser.add_argument(
+        "--label",
+        help="label of the rebalancing strategy under test (stored in the output)",
+        default="default",
+    )
+    parser.add_argument("--redis_address", default="localhost")
+    parser.add_argument("--s3_bucket", default="churn-benchmark-store")
+    parser.add_argument(
+        "--s3_endpoint",
+        help="S3-compatible endpoint (moto server, minio) to use instead of AWS",
+        default=None,
+    )
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--heartbeat_timeout", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--settle_seconds", type=int, default=10)
+    parser.add_argument(
+        "--unhealthy_grace",
+        help="seconds a killed node keeps receiving traffic, as behind an ELB",
+        type=int,
+        default=10,
+    )
+    parser.add_argument(
+        "--startup_timeout",
+        help="seconds a node may take to load its keys and turn healthy",
+        type=int,
+        default=3600,
+    )
+    parser.add_argument("--convergence_timeout", type=int, default=900)
+    parser.add_argument("--output", default="churn_results.json")
+
+    args = parser.parse_args()
+
+    benchmark = ChurnBenchmark(
+        redis_address=args.redis_address,
+        s3_bucket=args.s3_bucket,
+        s3_endpoint=args.s3_endpoint,
+        initial_nodes=args.nodes,
+        heartbeat_timeout=args.heartbeat_timeout,
+        concurrency=args.concurrency,
+        settle_seconds=args.settle_seconds,
+        unhealthy_grace=args.unhealthy_grace,
+        startup_timeout=args.startup_timeout,
+        convergence_timeout=args.convergence_timeout,
+    )
+    runs = [benchmark.run(key_count) for key_count in args.keys]
+    with open(args.output, "w") as f:
+        json.dump({"label": args.label, "runs": runs}, f, indent=2)
+    print(f"CHURN BENCHMARK DONE! results written to {args.output}")
@@ -1,11 +1,39 @@
 import datetime
 import http
+import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from boto3 import Session
 from botocore import exceptions
 
 UBUNTU_20_04_AMI = "ami-042e8287309f5df03"
+# deployment artifacts share the store bucket, outside the prefixes of the key store
+DEPLOYMENT_PREFIX = "_deployment/"
+
+BOOTSTRAP_SSH = "ssh"
+BOOTSTRAP_USER_DATA = "user_data"
+
+USER_DATA_TEMPLATE = """#!/bin/bash
+set -e
+mkdir -p /opt/cache-node && cd /opt/cache-node
+# the bundle is uploaded while the instances boot, wait for it like for the config
+until curl -sf -o bundle.tar.gz '{bundle_url}'; do sleep 5; done
+tar xzf bundle.tar.gz
+until curl -sf -o CONFIG.txt '{config_url}'; do sleep 5; done
+TOKEN=$(curl -s -X PUT http://169.254.169.254/latest/api/token -H "X-aws-ec2-metadata-token-ttl-seconds: 300")
+export NODE_IP=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/public-ipv4)
+source CONFIG.txt
+cd server
+PYTHONPATH=/opt/cache-node/site-packages nohup python3 main.py > /var/log/cache-node.log 2>&1 &
+"""
 
 
 class CacheAppDeployer(object):
@@ -14,22 +42,34 @@ class CacheAppDeployer(object):
         base_ec2_image=UBUNTU_20_04_AMI,
         base_instance_type="t3.micro",
         run_id=None,
+        session=None,
+        my_ip=None,
+        bootstrap_mode=BOOTSTRAP_SSH,
     ):
         self._run_id = run_id
-        self.session = Session()
+        self.session = session or Session()
+        # clients are created up-front - boto3 clients are thread-safe, sessions are not
         self.ec2_client = self.session.client("ec2")
         self.elb_client = self.session.client("elbv2")
         self.s3_client = self.session.client("s3")
+        self.elasticache_client = self.session.client("elasticache")
         self._base_image = base_ec2_image
         self._base_instance_type = base_instance_type
         self._elb_name = None
-
-        http_con = http.client.HTTPConnection("ipinfo.io")
-        http_con.request("GET", "/ip")
-        response = http_con.getresponse()
-        self.my_ip = response.read().decode()
+        self.bootstrap_mode = bootstrap_mode
+        # every invocation uploads its own bundle, so a scale-out never overwrites one
+        # that booting nodes may still be fetching
+        self._bundle_id = int(time.time())
+
+        if my_ip is None:
+            http_con = http.client.HTTPConnection("ipinfo.io")
+            http_con.request("GET", "/ip")
+            response = http_con.getresponse()
+            my_ip = response.read().decode()
+        self.my_ip = my_ip
         self.redis_host = None
         self._redis_cluster_id = None
+        self.phase_timings = {}
 
     @property
     def run_id(self):
@@ -57,6 +97,31 @@ class CacheAppDeployer(object):
     def bucket_name(self):
         return f"{self.run_id}-store"
 
+    @property
+    def bundle_key(self):
+        return f"{DEPLOYMENT_PREFIX}{self.run_id}/bundle-{self._bundle_id}.tar.gz"
+
+    @property
+    def node_config_key(self):
+        return f"{DEPLOYMENT_PREFIX}{self.run_id}/CONFIG.txt"
+
+    @contextmanager
+    def timed_phase(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.phase_timings[name] = time.time() - started
+            print(f"Phase {name} took {self.phase_timings[name]:.1f}s")
+
+    def report_phase_timings(self):
+        return "\n".join(
+            f"  {name}: {seconds:.1f}s" for name, seconds in self.phase_timings.items()
+        )
+
+    def _run_shell(self, command):
+        return os.system(command)
+
     def _create_run_id(self):
         run_id = int(datetime.datetime.utcnow().timestamp())
         print(f"Created Run ID: {run_id}")
@@ -162,57 +227,157 @@ class CacheAppDeployer(object):
         response = client.create_bucket(Bucket=bucket_name)
         return bucket_name
 
-    def create_instance(self, sg_id, key_pair_file, key_name, s3_bucket, redis_address):
+    def build_bundle(self, work_dir, target_python_version="3.8"):
+        # server code plus its dependencies installed for the AMI's python, so nodes
+        # need neither pip nor network access to PyPI
+        staging_dir = os.path.join(work_dir, "staging")
+        shutil.copytree(
+            "server",
+            os.path.join(staging_dir, "server"),
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+        subprocess.check_call(
+            [
+                sys.executable,
+                "-m",
+                "pip",
+                "install",
+                "--quiet",
+                "--target",
+                os.path.join(staging_dir, "site-packages"),
+                "--platform",
+                "manylinux2014_x86_64",
+                "--implementation",
+                "cp",
+                "--python-version",
+                target_python_version,
+                "--only-binary=:all:",
+                "-r",
+                "requirements.txt",
+            ]
+        )
+        archive = shutil.make_archive(
+            os.path.join(work_dir, "bundle"), "gztar", root_dir=staging_dir
+        )
+        print(f"Built deployment bundle {archive}")
+        return archive
+
+    def upload_bundle(self, s3_bucket):
+        with tempfile.TemporaryDirectory(prefix=f"{self.run_id}-bundle-") as work_dir:
+            archive = self.build_bundle(work_dir)
+            self.s3_client.upload_file(archive, s3_bucket, self.bundle_key)
+        print(f"Uploaded deployment bundle to s3://{s3_bucket}/{self.bundle_key}")
+
+    def upload_node_config(self, s3_bucket, redis_address):
+        session_creds = self.session.get_credentials()
+        config = "".join(
+            [
+                f"export STORE_BUCKET={s3_bucket}\n",
+                f"export AWS_ACCESS_KEY_ID={session_creds.access_key}\n",
+                f"export AWS_SECRET_ACCESS_KEY={session_creds.secret_key}\n",
+                f"export REDIS_ADDRESS={redis_address}\n",
+            ]
+        )
+        self.s3_client.put_object(
+            Bucket=s3_bucket, Key=self.node_config_key, Body=config.encode()
+        )
+
+    def remove_node_config(self, s3_bucket):
+        # the config holds the deployer's AWS secret, keep it only until the nodes read it
+        self.s3_client.delete_object(Bucket=s3_bucket, Key=self.node_config_key)
+        print(f"Removed node config s3://{s3_bucket}/{self.node_config_key}")
+
+    def create_user_data(self, s3_bucket, expires_in=3600):
+        # the config object may not exist yet - the script polls until it does
+        urls = {
+            name: self.s3_client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": s3_bucket, "Key": key},
+                ExpiresIn=expires_in,
+            )
+            for name, key in [
+                ("bundle_url", self.bundle_key),
+                ("config_url", self.node_config_key),
+            ]
+        }
+        return USER_DATA_TEMPLATE.format(**urls)
+
+    def launch_instances(self, sg_id, key_name, count=1, user_data=None):
         client = self.ec2_client
 
+        launch_args = {}
+        if user_data is not None:
+            launch_args["UserData"] = user_data
         response = client.run_instances(
             ImageId=self._base_image,
             InstanceType=self._base_instance_type,
             SecurityGroupIds=[sg_id],
-            MinCount=1,
-            MaxCount=1,
+            MinCount=count,
+            MaxCount=count,
             KeyName=key_name,
+            **launch_args,
+        )
+
+        instance_ids = [instance["InstanceId"] for instance in response["Instances"]]
+        print(
+            f"Instances {instance_ids} created... waiting for them to become available"
         )
+        return instance_ids
 
-        instance_id = response["Instances"][0]["InstanceId"]
-        print(f"Instance {instance_id} created... waiting for it to become available")
+    def wait_for_instances(self, instance_ids):
+        client = self.ec2_client
         waiter = client.get_waiter("instance_running")
-        waiter.wait(InstanceIds=[instance_id])
+        waiter.wait(InstanceIds=instance_ids)
 
-        describe_response = client.describe_instances(InstanceIds=[instance_id])
-        public_ip_address = describe_response["Reservations"][0]["Instances"][0][
-            "PublicIpAddress"
-        ]
-        print(f"Instance {instance_id} is running @ {public_ip_address}")
-        print("Deploying code to instance...")
+        describe_response = client.describe_instances(InstanceIds=instance_ids)
+        public_ips = {
+            instance["InstanceId"]: instance["PublicIpAddress"]
+            for reservation in describe_response["Reservations"]
+            for instance in reservation["Instances"]
+        }
+        for instance_id in instance_ids:
+            print(f"Instance {instance_id} is running @ {public_ips[instance_id]}")
+        return [(instance_id, public_ips[instance_id]) for instance_id in instance_ids]
+
+    def bootstrap_instance(
+        self, instance_id, public_ip_address, key_pair_file, s3_bucket, redis_address
+    ):
+        print(f"Deploying code to instance {instance_id}...")
 
         store_config_file = "CONFIG.txt"
         main_script = "main.sh"
         session_creds = self.session.get_credentials()
-        with open(store_config_file, "w") as f:
-            f.writelines(
-                [
-                    f"export STORE_BUCKET={s3_bucket}\n",
-                    f"export AWS_ACCESS_KEY_ID={session_creds.access_key}\n",
-                    f"export AWS_SECRET_ACCESS_KEY={session_creds.secret_key}\n",
-                    f"export REDIS_ADDRESS={redis_address}\n",
-                    f"export NODE_IP={public_ip_address}\n",
-                ]
+        # every instance gets its own staging dir so parallel bootstraps don't collide,
+        # and it's removed right after the copy since the config holds the AWS secret
+        with tempfile.TemporaryDirectory(prefix=f"{instance_id}-") as staging_dir:
+            with open(os.path.join(staging_dir, store_config_file), "w") as f:
+                f.writelines(
+                    [
+                        f"export STORE_BUCKET={s3_bucket}\n",
+                        f"export AWS_ACCESS_KEY_ID={session_creds.access_key}\n",
+                        f"export AWS_SECRET_ACCESS_KEY={session_creds.secret_key}\n",
+                        f"export REDIS_ADDRESS={redis_address}\n",
+                        f"export NODE_IP={public_ip_address}\n",
+                    ]
+                )
+
+            with open(os.path.join(staging_dir, main_script), "w") as f:
+                f.writelines(
+                    [
+                        "#! /bin/bash\n"
+                        f"source {store_config_file} && python3 main.py\n"
+                    ]
+                )
+
+            scp_command = (
+                f'scp -i {key_pair_file} -o "StrictHostKeyChecking=no" -o "ConnectionAttempts=60" '
+                f"requirements.txt {staging_dir}/{store_config_file} {staging_dir}/{main_script} "
+                f"server/main.py server/cache_ring_management.py server/store_layout.py ubuntu@{public_ip_address}:/home/ubuntu/"
             )
 
-        with open(main_script, "w") as f:
-            f.writelines(
-                ["#! /bin/bash\n" f"source {store_config_file} && python3 main.py\n"]
-            )
+            self._run_shell(scp_command)
 
-        scp_command = (
-            f'scp -i {key_pair_file} -o "StrictHostKeyChecking=no" -o "ConnectionAttempts=60" '
-            f"requirements.txt {store_config_file} {main_script} server/main.py server/cache_ring_management.py ubuntu@{public_ip_address}:/home/ubuntu/"
-        )
-
-        os.system(scp_command)
-
-        print("Code deployment done... setting up dependencies...")
+        print(f"Code deployment to {instance_id} done... setting up dependencies...")
         installation_commands = [
             "sudo apt update",
             "sudo apt install python3-pip -y",
@@ -221,14 +386,31 @@ class CacheAppDeployer(object):
         ]
         ssh_base = f'ssh -i {key_pair_file} -o "StrictHostKeyChecking=no" -o "ConnectionAttempts=10" ubuntu@{public_ip_address}'
         for cmd in installation_commands:
-            print(cmd)
+            print(f"{instance_id}: {cmd}")
             ssh_command = f"{ssh_base} '{cmd}'"
-            os.system(ssh_command)
+            self._run_shell(ssh_command)
         print(
             f"Code deployed... server is running on instance {instance_id} ({public_ip_address}:5000)"
         )
         return instance_id, public_ip_address
 
+    def bootstrap_instances(self, instances, key_pair_file, s3_bucket, redis_address):
+        if not instances:
+            return []
+        with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+            futures = [
+                executor.submit(
+                    self.bootstrap_instance,
+                    instance_id=instance_id,
+                    public_ip_address=public_ip_address,
+                    key_pair_file=key_pair_file,
+                    s3_bucket=s3_bucket,
+                    redis_address=redis_address,
+                )
+                for instance_id, public_ip_address in instances
+            ]
+            return [future.result() for future in futures]
+
     def create_elb(self):
         client = self.elb_client
         response = None
@@ -288,10 +470,93 @@ class CacheAppDeployer(object):
 
         return target_group_arn
 
-    def register_instance_in_elb(self, instance_id, target_group_arn):
+    def bootstrap_nodes(self, instances, key_pair_file, s3_bucket, redis_address):
+        if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+            # nodes bootstrap themselves once their config shows up
+            self.upload_node_config(s3_bucket=s3_bucket, redis_address=redis_address)
+        else:
+            self.bootstrap_instances(
+                instances,
+                key_pair_file=key_pair_file,
+                s3_bucket=s3_bucket,
+                redis_address=redis_address,
+            )
+
+    def wait_for_healthy_targets(self, instance_ids, target_group_arn, launched_at):
+        waiter = self.elb_client.get_waiter("target_in_service")
+        waiter.wait(
+            TargetGroupArn=target_group_arn,
+            Targets=[{"Id": instance_id, "Port": 5000} for instance_id in instance_ids],
+        )
+        self.phase_timings["launch_to_healthy"] = time.time() - launched_at
+        print(
+            f"Instances {instance_ids} healthy "
+            f"{self.phase_timings['launch_to_healthy']:.1f}s after launch"
+        )
+
+    def register_instances_in_elb(self, instance_ids, target_group_arn):
         self.elb_client.register_targets(
-            TargetGroupArn=target_group_arn, Targets=[{"Id": instance_id, "Port": 5000}]
+            TargetGroupArn=target_group_arn,
+            Targets=[{"Id": instance_id, "Port": 5000} for instance_id in instance_ids],
+        )
+
+    def deregister_instances_from_elb(self, instance_ids, target_group_arn):
+        targets = [{"Id": instance_id, "Port": 5000} for instance_id in instance_ids]
+        self.elb_client.deregister_targets(
+            TargetGroupArn=target_group_arn, Targets=targets
         )
+        return targets
+
+    def get_fleet(self):
+        target_group_arn = self.get_target_group()
+        health_response = self.elb_client.describe_target_health(
+            TargetGroupArn=target_group_arn
+        )
+        instance_ids = [
+            description["Target"]["Id"]
+            for description in health_response["TargetHealthDescriptions"]
+            if description["TargetHealth"]["State"] != "draining"
+        ]
+        if not instance_ids:
+            return []
+        describe_response = self.ec2_client.describe_instances(InstanceIds=instance_ids)
+        # stopping or terminated instances may still be listed, but have no address
+        return [
+            (instance["InstanceId"], instance["PublicIpAddress"])
+            for reservation in describe_response["Reservations"]
+            for instance in reservation["Instances"]
+            if instance.get("PublicIpAddress")
+        ]
+
+    def drain_node(self, public_ip_address):
+        http_con = http.client.HTTPConnection(public_ip_address, 5000, timeout=600)
+        http_con.request("POST", "/internal/drain")
+        response = http_con.getresponse()
+        result = json.loads(response.read().decode())
+        print(
+            f"Node {public_ip_address} drained, "
+            f"handed off {result['handed_off_keys']} keys"
+        )
+        return result
+
+    def retire_instance(self, instance_id, public_ip_address):
+        target_group_arn = self.get_target_group()
+        with self.timed_phase("deregister_targets"):
+            targets = self.deregister_instances_from_elb(
+                instance_ids=[instance_id], target_group_arn=target_group_arn
+            )
+        # the node stays up until the load balancer stops routing to it
+        with self.timed_phase("drain"):
+            try:
+                self.drain_node(public_ip_address)
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                # its keys are still in S3, the remaining nodes reload them on refresh
+                print(f"Draining {instance_id} failed, retiring it anyway: {e}")
+            waiter = self.elb_client.get_waiter("target_deregistered")
+            waiter.wait(TargetGroupArn=target_group_arn, Targets=targets)
+        with self.timed_phase("terminate"):
+            self.ec2_client.terminate_instances(InstanceIds=[instance_id])
+        print(f"Instance {instance_id} ({public_ip_address}) retired")
 
     def get_security_groups(self):
         instance_group_name = f"cc-sg-{self.run_id}"
@@ -311,32 +576,68 @@ class CacheAppDeployer(object):
             result[group_key] = (group_name, group_id)
         return result
 
-    def deploy_app(self):
+    def deploy_app(self, instance_count=1):
         # region = get_region()
         # aws_account = get_account()
 
-        key_pair_file, key_name = self.create_key_pair()
-        elb_arn, vpc_id, elb_endpoint = self.create_elb()
-        security_groups = self.create_security_groups(vpc_id=vpc_id, elb_arn=elb_arn)
-
-        instances_sg_id = security_groups["instances"][1]
-
-        redis_address = self.create_redis(sg_id=instances_sg_id)
-        target_group_arn = self.create_target_group_and_listeners(
-            vpc_id=vpc_id, elb_arn=elb_arn
-        )
-        s3_bucket = self.create_s3_bucket()
-        instance_id, instance_ip = self.create_instance(
-            sg_id=instances_sg_id,
-            key_pair_file=key_pair_file,
-            key_name=key_name,
-            s3_bucket=s3_bucket,
-            redis_address=redis_address,
-        )
+        # resolve the run id before fanning out, every resource name derives from it
+        print(f"Deploying run {self.run_id}")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            with self.timed_phase("base_resources"):
+                key_pair_future = executor.submit(self.create_key_pair)
+                elb_future = executor.submit(self.create_elb)
+                s3_future = executor.submit(self.create_s3_bucket)
+                key_pair_file, key_name = key_pair_future.result()
+                elb_arn, vpc_id, elb_endpoint = elb_future.result()
+
+            with self.timed_phase("network"):
+                target_group_future = executor.submit(
+                    self.create_target_group_and_listeners,
+                    vpc_id=vpc_id,
+                    elb_arn=elb_arn,
+                )
+                security_groups = self.create_security_groups(
+                    vpc_id=vpc_id, elb_arn=elb_arn
+                )
+            instances_sg_id = security_groups["instances"][1]
+
+            # redis and the instances only meet at bootstrap time, so both are brought
+            # up side by side
+            with self.timed_phase("redis_and_instances"):
+                redis_future = executor.submit(self.create_redis, sg_id=instances_sg_id)
+                s3_bucket = s3_future.result()
+                user_data = None
+                if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+                    bundle_future = executor.submit(self.upload_bundle, s3_bucket)
+                    user_data = self.create_user_data(s3_bucket)
+                instance_ids = self.launch_instances(
+                    sg_id=instances_sg_id,
+                    key_name=key_name,
+                    count=instance_count,
+                    user_data=user_data,
+                )
+                launched_at = time.time()
+                instances = self.wait_for_instances(instance_ids)
+                redis_address = redis_future.result()
+                target_group_arn = target_group_future.result()
+                if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+                    bundle_future.result()
+
+        with self.timed_phase("bootstrap"):
+            self.bootstrap_nodes(
+                instances,
+                key_pair_file=key_pair_file,
+                s3_bucket=s3_bucket,
+                redis_address=redis_address,
+            )
 
-        self.register_instance_in_elb(
-            instance_id=instance_id, target_group_arn=target_group_arn
-        )
+        with self.timed_phase("register_targets"):
+            self.register_instances_in_elb(
+                instance_ids=instance_ids, target_group_arn=target_group_arn
+            )
+        self.wait_for_healthy_targets(instance_ids, target_group_arn, launched_at)
+        if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+            self.remove_node_config(s3_bucket)
 
         return elb_endpoint
 
@@ -347,28 +648,54 @@ class CacheAppDeployer(object):
         target_group_arn = target_group_response["TargetGroups"][0]["TargetGroupArn"]
         return target_group_arn
 
-    def add_instance_to_existing_deployment(self):
+    def add_instances_to_existing_deployment(self, count=1):
         key_name = self.key_name
         key_pair_file = f"{key_name}.pem"
-        security_groups = self.get_security_groups()
         bucket_name = self.bucket_name
-        redis_address = self.get_redis_address()
-
-        instance_id, instance_ip = self.create_instance(
-            sg_id=security_groups["instances"][1],
-            key_pair_file=key_pair_file,
-            key_name=key_name,
-            s3_bucket=bucket_name,
-            redis_address=redis_address,
-        )
 
-        target_group_arn = self.get_target_group()
-        self.register_instance_in_elb(
-            instance_id=instance_id, target_group_arn=target_group_arn
-        )
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            with self.timed_phase("lookup"):
+                redis_future = executor.submit(self.get_redis_address)
+                target_group_future = executor.submit(self.get_target_group)
+                security_groups = self.get_security_groups()
+
+            with self.timed_phase("launch_instances"):
+                user_data = None
+                if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+                    bundle_future = executor.submit(self.upload_bundle, bucket_name)
+                    user_data = self.create_user_data(bucket_name)
+                instance_ids = self.launch_instances(
+                    sg_id=security_groups["instances"][1],
+                    key_name=key_name,
+                    count=count,
+                    user_data=user_data,
+                )
+                launched_at = time.time()
+                instances = self.wait_for_instances(instance_ids)
+                redis_address = redis_future.result()
+                target_group_arn = target_group_future.result()
+                if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+                    bundle_future.result()
+
+        with self.timed_phase("bootstrap"):
+            self.bootstrap_nodes(
+                instances,
+                key_pair_file=key_pair_file,
+                s3_bucket=bucket_name,
+                redis_address=redis_address,
+            )
+
+        with self.timed_phase("register_targets"):
+            self.register_instances_in_elb(
+                instance_ids=instance_ids, target_group_arn=target_group_arn
+            )
+        self.wait_for_healthy_targets(instance_ids, target_group_arn, launched_at)
+        if self.bootstrap_mode == BOOTSTRAP_USER_DATA:
+            self.remove_node_config(bucket_name)
+        return instances
 
     def create_redis(self, sg_id):
-        client = self.session.client("elasticache")
+        client = self.elasticache_client
         cluster_id = self.redis_cluster_id
         response = client.create_cache_cluster(
             CacheClusterId=cluster_id,
@@ -393,7 +720,7 @@ class CacheAppDeployer(object):
         return redis_address
 
     def get_redis_address(self):
-        client = self.session.client("elasticache")
+        client = self.elasticache_client
         describe_response = client.describe_cache_clusters(
             CacheClusterId=self.redis_cluster_id, ShowCacheNodeInfo=True
         )
@@ -418,20 +745,35 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--add_instance",
-        help="add an instance to the deployment",
-        action="store_true",
-        default=False,
+        help="add N instances (1 if omitted) to the deployment",
+        type=int,
+        nargs="?",
+        const=1,
+        default=0,
+    )
+    parser.add_argument(
+        "--instances",
+        help="number of instances to create on initial deployment",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--bootstrap",
+        help="how nodes get their code: scp+ssh, or a prebuilt bundle fetched by cloud-init user-data",
+        choices=[BOOTSTRAP_SSH, BOOTSTRAP_USER_DATA],
+        default=BOOTSTRAP_SSH,
     )
 
     args = parser.parse_args()
 
-    deployer = CacheAppDeployer(run_id=args.run_id)
+    deployer = CacheAppDeployer(run_id=args.run_id, bootstrap_mode=args.bootstrap)
     if args.add_instance:
         assert args.run_id, "Cannot add an instance without providing the run ID"
-        deployer.add_instance_to_existing_deployment()
-        print("ADDING INSTANCE IS DONE")
+        deployer.add_instances_to_existing_deployment(count=args.add_instance)
+        print(f"ADDING {args.add_instance} INSTANCE(S) IS DONE")
+        print(f"PHASE TIMINGS:\n{deployer.report_phase_timings()}")
     else:
-        endpoint = deployer.deploy_app()
+        endpoint = deployer.deploy_app(instance_count=args.instances)
         print(
             "\n".join(
                 [
@@ -441,6 +783,7 @@ if __name__ == "__main__":
                     f"S3 BUCKET: {deployer.bucket_name}",
                     f"PEM FILE: {deployer.key_name}.pem",
                     f"REDIS HOST: {deployer.redis_host}",
+                    f"PHASE TIMINGS:\n{deployer.report_phase_timings()}",
                 ]
             )
         )
@@ -1,12 +1,14 @@
 import datetime
-import json
+import time
 import requests
-import pytz
 
+from concurrent.futures import ThreadPoolExecutor, wait
 from uhashring import HashRing
 from redis import StrictRedis
 from typing import Any, Dict, List, Optional, Union
 
+from store_layout import ShardedStore, all_shards, shard_of
+
 
 class CacheRingManager(object):
     def __init__(
@@ -28,8 +30,24 @@ class CacheRingManager(object):
         self.bucket = s3_bucket
         self.s3_client = s3_client
         self.nodes_count = 1
+        self.stats = {
+            "s3_list_requests": 0,
+            "s3_get_requests": 0,
+            "s3_put_requests": 0,
+            "s3_delete_requests": 0,
+            "s3_bytes_loaded": 0,
+            "compacted_keys": 0,
+            "refresh_count": 0,
+            "last_refresh_seconds": None,
+            "last_refresh_finished": None,
+        }
+
+        self.store = ShardedStore(
+            s3_client=s3_client, bucket=s3_bucket, stats=self.stats
+        )
 
         self.refresh_required = False
+        self.draining = False
         self.set_heartbeat()
         self.refresh_cache()
         self.send_refresh_to_all_nodes()
@@ -59,6 +77,9 @@ class CacheRingManager(object):
         return result
 
     def set_heartbeat(self):
+        if self.draining:
+            return
+
         now = self.now().timestamp()
         self.redis.set(
             name=f"node_{self.ip}", value=now, ex=self.heartbeat_timeout.seconds * 5
@@ -69,19 +90,75 @@ class CacheRingManager(object):
 
         else:
             # clear expired entries from memory
+            now = self.now()
             self.cache_dict = {
                 key: value for key, value in self.cache_dict.items() if value[1] >= now
             }
 
+    def drain(self, timeout: int = 120, workers: int = 16) -> int:
+        # the new owners are computed without this node, but it keeps heartbeating
+        # (and serving its shards) until they hold its keys
+        nodes = [node for node in self.get_live_nodes() if node != self.ip]
+        if not nodes:
+            return 0
+
+        now = self.now()
+        shard_owners = {}
+        handoffs = []
+        for key, (value, expiration_date) in list(self.cache_dict.items()):
+            if expiration_date < now:
+                continue
+            shard = shard_of(key)
+            if shard not in shard_owners:
+                shard_owners[shard] = self.get_nodes_for_shard(shard=shard, nodes=nodes)
+            for node_ip in shard_owners[shard]:
+                if node_ip is not None:
+                    handoffs.append((key, value, expiration_date, node_ip))
+
+        def hand_off(handoff):
+            key, value, expiration_date, node_ip = handoff
+            try:
+                self._set_remote_cache(
+                    key=key,
+                    value=value,
+                    expiration_date=expiration_date,
+                    ip=node_ip,
+                    timeout=5,
+                )
+                return key
+            except Exception as e:
+                print(f"Failed handing off {key} to {node_ip}: {e}")
+
+        # bounded - whatever isn't handed off in time is reloaded from S3 on refresh
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(hand_off, handoff) for handoff in handoffs]
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+        # only now leave the ring
+        self.draining = True
+        self.redis.delete(f"node_{self.ip}")
+        self.send_refresh_to_all_nodes()
+        return len({future.result() for future in done} - {None})
+
     def get_nodes_for_key(
         self, key: str, nodes: Optional[List[str]] = None
     ) -> List[str]:
+        return self.get_nodes_for_shard(shard=shard_of(key), nodes=nodes)
+
+    def get_nodes_for_shard(
+        self, shard: str, nodes: Optional[List[str]] = None
+    ) -> List[str]:
+        # keys are placed by their S3 shard, so a node's share of the ring is a set of
+        # whole shards it can load from the shard manifests
         nodes = nodes or self.get_live_nodes()
         ring = HashRing(nodes=nodes)
-        primary_node = ring.get_node(key=key)
+        primary_node = ring.get_node(key=shard)
 
         sec_ring = HashRing(nodes=[node for node in nodes if node != primary_node])
-        secondary_node = sec_ring.get_node(key=key)
+        secondary_node = sec_ring.get_node(key=shard)
 
         return [primary_node, secondary_node]
 
@@ -126,57 +203,48 @@ class CacheRingManager(object):
                 self._set_remote_cache(
                     key=key, value=value, expiration_date=expiration_date, ip=node_ip
                 )
-        self.s3_client.put_object(
-            Bucket=self.bucket, Key=key, Body=json.dumps(value), Expires=expiration_date
-        )
+        self.store.put(key=key, value=value, expiration_date=expiration_date)
 
     def refresh_cache(self):
+        started = time.time()
         result = {}
+        owned_shards = set()
         nodes = self.get_live_nodes()
-        for key in self.get_all_persisted_keys():
-            key_nodes = self.get_nodes_for_key(key=key, nodes=nodes)
-            if self.ip in key_nodes:
-                value = self.load_value_from_persistence(key=key)
+        for shard in all_shards():
+            if self.ip not in self.get_nodes_for_shard(shard=shard, nodes=nodes):
+                continue
+            owned_shards.add(shard)
+            for key in self.store.live_keys(shard=shard):
+                value = self.store.get(key=key)
                 if value is not None:
                     result[key] = value
+
+        # merge rather than replace - keys handed off by a draining node (or written
+        # while the refresh ran) are kept for the shards this node still owns
+        now = self.now()
+        for key, value in list(self.cache_dict.items()):
+            if key not in result and value[1] >= now and shard_of(key) in owned_shards:
+                result[key] = value
         self.cache_dict = result
         self.refresh_required = False
 
-    def get_all_persisted_keys(self, max_keys=1000):
-        response = self.s3_client.list_objects_v2(Bucket=self.bucket, MaxKeys=max_keys)
-        if "Contents" not in response:
-            return []
-        for record in response["Contents"]:
-            yield record["Key"]
-
-        while response["IsTruncated"]:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket,
-                MaxKeys=max_keys,
-                ContinuationToken=response["NextContinuationToken"],
-            )
-            for record in response["Contents"]:
-                yield record["Key"]
-
-    def load_value_from_persistence(
-        self,
-        key,
-    ):
-        result = None
-        try:
-            response = self.s3_client.get_object(
-                Bucket=self.bucket,
-                Key=key,
-            )
-            if response["Expires"] >= pytz.utc.localize(datetime.datetime.utcnow()):
-                non_localized = datetime.datetime.fromisoformat(
-                    response["Expires"].isoformat().split("+")[0]
-                )
-                result = json.loads(response["Body"].read()), non_localized
-        except Exception as e:
-            print(e)
+        finished = time.time()
+        self.stats["refresh_count"] += 1
+        self.stats["last_refresh_seconds"] = finished - started
+        self.stats["last_refresh_finished"] = finished
 
-        return result
+    def compact_owned_shards(self):
+        if self.draining:
+            return
+        nodes = self.get_live_nodes()
+        for shard in all_shards():
+            # only the primary owner compacts, the manifest write is conditional anyway
+            if self.get_nodes_for_shard(shard=shard, nodes=nodes)[0] != self.ip:
+                continue
+            try:
+                self.stats["compacted_keys"] += self.store.compact_shard(shard=shard)
+            except Exception as e:
+                print(f"Failed compacting shard {shard}: {e}")
 
     def _set_remote_cache(
         self,
@@ -184,10 +252,12 @@ class CacheRingManager(object):
         value,
         expiration_date,
         ip,
+        timeout=None,
     ):
         response = requests.put(
             url=f"http://{ip}:{self.port}/internal/keys/{key}",
             json={"data": value, "expiration_date": expiration_date.isoformat()},
+            timeout=timeout,
         )
 
     def _get_remote_cache(
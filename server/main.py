@@ -1,6 +1,8 @@
 import datetime
 import json
 import os
+import threading
+import time
 
 
 from boto3 import Session
@@ -10,6 +12,9 @@ from cache_ring_management import CacheRingManager
 
 
 APP_PORT = 5000
+BIND_ADDRESS = os.environ.get("BIND_ADDRESS", "0.0.0.0")
+HEARTBEAT_TIMEOUT = int(os.environ.get("HEARTBEAT_TIMEOUT", 100))
+COMPACTION_INTERVAL = int(os.environ.get("COMPACTION_INTERVAL", 600))
 
 REDIS_IP = os.environ["REDIS_ADDRESS"]
 MY_BUCKET = os.environ["STORE_BUCKET"]
@@ -24,12 +29,34 @@ app.cache_manager = CacheRingManager(
     port=APP_PORT,
     redis_client=redis_client,
     nodes_list_key="nodes_list",
-    heartbeat_timeout=100,
+    heartbeat_timeout=HEARTBEAT_TIMEOUT,
     s3_bucket=MY_BUCKET,
     s3_client=app.aws_session.client("s3"),
 )
 
 
+def _compaction_loop():
+    while True:
+        time.sleep(COMPACTION_INTERVAL)
+        try:
+            app.cache_manager.compact_owned_shards()
+        except Exception as e:
+            # e.g. redis being unreachable - keep the loop alive for the next round
+            print(f"Compaction failed: {e}")
+
+
+threading.Thread(target=_compaction_loop, daemon=True).start()
+
+
+def _memory_used_percent():
+    meminfo = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            name, value = line.split(":", 1)
+            meminfo[name] = int(value.split()[0])
+    return 100.0 * (1 - meminfo["MemAvailable"] / meminfo["MemTotal"])
+
+
 @app.route("/health")
 def healthcheck():
     app.cache_manager.set_heartbeat()
@@ -81,6 +108,23 @@ def refresh_cache():
     return jsonify({"status": "ok"})
 
 
+@app.route("/internal/stats", methods=["GET"])
+def get_stats():
+    result = dict(app.cache_manager.stats)
+    result["keys_in_memory"] = len(app.cache_manager.cache_dict)
+    result["live_nodes"] = app.cache_manager.get_live_nodes()
+    result["draining"] = app.cache_manager.draining
+    result["cpu_load"] = os.getloadavg()[0] / os.cpu_count()
+    result["memory_percent"] = _memory_used_percent()
+    return jsonify(result)
+
+
+@app.route("/internal/drain", methods=["POST"])
+def drain():
+    handed_off = app.cache_manager.drain()
+    return jsonify({"status": "ok", "handed_off_keys": handed_off})
+
+
 # DEBUG METHOD
 
 
@@ -91,4 +135,4 @@ def get_all_nodes():
 
 
 if __name__ == "__main__":
-    app.run("0.0.0.0", port=APP_PORT)
+    app.run(BIND_ADDRESS, port=APP_PORT)
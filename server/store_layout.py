@@ -0,0 +1,263 @@
+import datetime
+import hashlib
+import json
+import time
+
+import pytz
+
+from botocore import exceptions
+from typing import Any, Dict, List, Optional, Tuple
+
+# persisted keys live under keys/<shard>/<key>. Writes also drop an empty marker under
+# pending/<shard>/<key>/<version>_<expires> that the compactor folds into the shard's
+# manifest (manifests/<shard>.json), so a shard's live keys are known from one GET and
+# one short listing instead of a listing of the whole bucket.
+SHARDS_COUNT = 256
+KEYS_PREFIX = "keys/"
+PENDING_PREFIX = "pending/"
+MANIFESTS_PREFIX = "manifests/"
+
+CONFLICT_ERROR_CODES = {"PreconditionFailed", "ConditionalRequestConflict"}
+
+
+def shard_of(key: str) -> str:
+    return hashlib.md5(key.encode()).hexdigest()[:2]
+
+
+def all_shards() -> List[str]:
+    return [f"{shard:02x}" for shard in range(SHARDS_COUNT)]
+
+
+def to_timestamp(expiration_date: datetime.datetime) -> int:
+    # naive datetimes across the service are UTC
+    return int(expiration_date.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+class ShardedStore(object):
+    def __init__(self, s3_client, bucket: str, stats: Optional[Dict[str, Any]] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.stats = stats if stats is not None else {}
+
+    def _count(self, counter, amount=1):
+        self.stats[counter] = self.stats.get(counter, 0) + amount
+
+    def object_key(self, key: str) -> str:
+        return f"{KEYS_PREFIX}{shard_of(key)}/{key}"
+
+    def manifest_key(self, shard: str) -> str:
+        return f"{MANIFESTS_PREFIX}{shard}.json"
+
+    def put(self, key: str, value: Any, expiration_date: datetime.datetime):
+        version = time.time_ns()
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            Body=json.dumps(value),
+            Expires=expiration_date,
+            Metadata={"version": str(version)},
+        )
+        self._put_marker(key, version, to_timestamp(expiration_date))
+
+    def _put_marker(self, key, version, expires):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=f"{PENDING_PREFIX}{shard_of(key)}/{key}/{version}_{expires}",
+            Body=b"",
+        )
+        self._count("s3_put_requests", 2)
+
+    def get(self, key: str) -> Optional[Tuple[Any, datetime.datetime]]:
+        result = None
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket,
+                Key=self.object_key(key),
+            )
+            self._count("s3_get_requests")
+            if response["Expires"] >= pytz.utc.localize(datetime.datetime.utcnow()):
+                non_localized = datetime.datetime.fromisoformat(
+                    response["Expires"].isoformat().split("+")[0]
+                )
+                body = response["Body"].read()
+                self._count("s3_bytes_loaded", len(body))
+                result = json.loads(body), non_localized
+        except Exception as e:
+            print(e)
+
+        return result
+
+    def _list(self, prefix, **kwargs):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, **kwargs):
+            self._count("s3_list_requests")
+            yield page
+
+    def _read_manifest(self, shard):
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self.manifest_key(shard)
+            )
+        except exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "NoSuchKey":
+                raise e
+            return {}, None
+        self._count("s3_get_requests")
+        body = response["Body"].read()
+        self._count("s3_bytes_loaded", len(body))
+        entries = {key: tuple(entry) for key, entry in json.loads(body).items()}
+        return entries, response["ETag"]
+
+    def _read_pending(self, shard):
+        prefix = f"{PENDING_PREFIX}{shard}/"
+        markers = []
+        for page in self._list(prefix):
+            for record in page.get("Contents", []):
+                key, marker = record["Key"][len(prefix) :].rsplit("/", 1)
+                version, expires = marker.split("_")
+                markers.append((record["Key"], key, int(expires), int(version)))
+        return markers
+
+    def read_shard_index(self, shard: str, with_etag=False):
+        entries, etag = self._read_manifest(shard)
+        markers = self._read_pending(shard)
+        for _, key, expires, version in markers:
+            if key not in entries or entries[key][1] < version:
+                entries[key] = (expires, version)
+        if with_etag:
+            return entries, etag, markers
+        return entries
+
+    def live_keys(self, shard: str, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        return [
+            key
+            for key, (expires, _) in self.read_shard_index(shard).items()
+            if expires >= now
+        ]
+
+    def _is_current(self, key, version):
+        try:
+            response = self.s3_client.head_object(
+                Bucket=self.bucket, Key=self.object_key(key)
+            )
+        except exceptions.ClientError:
+            return False
+        return int(response["Metadata"].get("version", 0)) == version
+
+    def _exists(self, object_key):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=object_key)
+        except exceptions.ClientError:
+            return False
+        return True
+
+    def _delete(self, object_keys):
+        for i in range(0, len(object_keys), 1000):
+            batch = object_keys[i : i + 1000]
+            self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            self._count("s3_delete_requests")
+
+    def compact_shard(self, shard: str, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        entries, etag, markers = self.read_shard_index(shard, with_etag=True)
+        expired = {
+            key: version for key, (expires, version) in entries.items() if expires < now
+        }
+        if not expired and not markers:
+            return 0
+        live = {key: entry for key, entry in entries.items() if key not in expired}
+
+        manifest_args = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.manifest_key(shard),
+                Body=json.dumps(live, separators=(",", ":")),
+                **manifest_args,
+            )
+            self._count("s3_put_requests")
+        except exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in CONFLICT_ERROR_CODES:
+                raise e
+            # another node compacted this shard in the meantime, leave it to them
+            return 0
+
+        # a key re-written since the index was read has a newer marker and a newer
+        # object version. Both are checked right before each delete, so only a put
+        # landing between the HEAD and the DELETE of that very key can slip through
+        rewritten = {
+            key
+            for _, key, _, version in self._read_pending(shard)
+            if key in expired and version > expired[key]
+        }
+        removed = 0
+        for key, version in expired.items():
+            if key in rewritten or not self._is_current(key, version):
+                continue
+            self.s3_client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+            self._count("s3_delete_requests")
+            removed += 1
+        self._delete([marker[0] for marker in markers])
+        return removed
+
+    def migrate_flat_layout(self) -> int:
+        migrated = 0
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for page in self._list("", Delimiter="/"):
+            for record in page.get("Contents", []):
+                key = record["Key"]
+                response = self.s3_client.head_object(Bucket=self.bucket, Key=key)
+                if "Expires" not in response:
+                    continue
+                # an expired key is dropped, and one already re-written to the sharded
+                # layout (by a node running the new code) keeps the fresher copy
+                expired = response["Expires"] < now
+                if not expired and not self._exists(self.object_key(key)):
+                    self._migrate_key(key, response["Expires"])
+                    migrated += 1
+                self.s3_client.delete_object(Bucket=self.bucket, Key=key)
+                self._count("s3_delete_requests")
+        return migrated
+
+    def _migrate_key(self, key, expires):
+        version = time.time_ns()
+        self.s3_client.copy_object(
+            Bucket=self.bucket,
+            Key=self.object_key(key),
+            CopySource={"Bucket": self.bucket, "Key": key},
+            Expires=expires,
+            Metadata={"version": str(version)},
+            MetadataDirective="REPLACE",
+        )
+        self._put_marker(key, version, int(expires.timestamp()))
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    from boto3 import Session
+
+    parser = ArgumentParser("HW2_STORE_MIGRATION")
+
+    parser.add_argument(
+        "--bucket", help="store bucket with keys at its root", required=True
+    )
+    parser.add_argument(
+        "--compact",
+        help="fold the migrated keys into per-shard manifests right away",
+        action="store_true",
+        default=False,
+    )
+
+    args = parser.parse_args()
+
+    store = ShardedStore(s3_client=Session().client("s3"), bucket=args.bucket)
+    migrated = store.migrate_flat_layout()
+    print(f"Migrated {migrated} keys to the sharded layout")
+    if args.compact:
+        removed = sum(store.compact_shard(shard) for shard in all_shards())
+        print(f"Compacted {SHARDS_COUNT} shards, removed {removed} expired keys")
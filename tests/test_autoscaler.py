@@ -0,0 +1,214 @@
+import pytest
+
+from autoscaler import AutoscalingController, ScalingPolicy
+
+
+class FakeMetricsSource(object):
+    def __init__(self):
+        self.metrics = {}
+
+    def set_fleet(self, nodes_count, cpu_load, memory_percent=30.0, unreachable=()):
+        self.metrics = {
+            f"i-{i}": {
+                "cpu_load": cpu_load,
+                "memory_percent": memory_percent,
+                "keys_in_memory": 100 + i,
+                "public_ip_address": f"10.0.0.{i}",
+            }
+            for i in range(nodes_count)
+        }
+        for instance_id in unreachable:
+            self.metrics[instance_id] = None
+
+    def get_metrics(self):
+        return self.metrics
+
+
+class StubDeployer(object):
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def add_instances_to_existing_deployment(self, count):
+        self.calls.append(("add", count))
+        if self.fail:
+            raise RuntimeError("launch failed")
+
+    def retire_instance(self, instance_id, public_ip_address):
+        self.calls.append(("retire", instance_id, public_ip_address))
+        if self.fail:
+            raise RuntimeError("drain timed out")
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def metrics():
+    return FakeMetricsSource()
+
+
+@pytest.fixture
+def deployer():
+    return StubDeployer()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_controller(deployer, metrics, clock, **policy_args):
+    policy_args.setdefault("breach_periods", 3)
+    policy_args.setdefault("cooldown", 300)
+    return AutoscalingController(
+        deployer=deployer,
+        metrics_source=metrics,
+        policy=ScalingPolicy(**policy_args),
+        clock=clock,
+    )
+
+
+def tick(controller, clock, times=1, dry_run=False):
+    decisions = []
+    for _ in range(times):
+        decisions.append(controller.step(dry_run=dry_run))
+        clock.now += 60
+    return decisions
+
+
+def test_scale_out_needs_consecutive_breaches(deployer, metrics, clock):
+    controller = make_controller(deployer, metrics, clock)
+    metrics.set_fleet(3, cpu_load=0.9)
+    assert tick(controller, clock, times=2) == [None, None]
+
+    # a single calm sample resets the streak
+    metrics.set_fleet(3, cpu_load=0.5)
+    tick(controller, clock)
+    metrics.set_fleet(3, cpu_load=0.9)
+    assert tick(controller, clock, times=2) == [None, None]
+    assert deployer.calls == []
+
+    assert tick(controller, clock) == [("scale_out", 1)]
+    assert deployer.calls == [("add", 1)]
+
+
+def test_memory_pressure_triggers_scale_out(deployer, metrics, clock):
+    controller = make_controller(deployer, metrics, clock, breach_periods=1)
+    metrics.set_fleet(3, cpu_load=0.1, memory_percent=90.0)
+    assert tick(controller, clock) == [("scale_out", 1)]
+
+
+def test_cooldown_ignores_samples_taken_during_it(deployer, metrics, clock):
+    controller = make_controller(deployer, metrics, clock, cooldown=300)
+    metrics.set_fleet(3, cpu_load=0.9)
+    tick(controller, clock, times=3)
+    assert deployer.calls == [("add", 1)]
+
+    # the rebalance keeps the fleet idle through the whole cooldown
+    metrics.set_fleet(4, cpu_load=0.1)
+    assert tick(controller, clock, times=4) == [None] * 4
+    assert not controller.in_cooldown()
+
+    # the streak only starts counting once the cooldown is over
+    assert tick(controller, clock, times=2) == [None, None]
+    assert tick(controller, clock) == [("scale_in", "i-0")]
+
+
+def test_fleet_size_limits(deployer, metrics, clock):
+    controller = make_controller(
+        deployer, metrics, clock, min_nodes=2, max_nodes=3, breach_periods=1
+    )
+    metrics.set_fleet(3, cpu_load=0.9)
+    assert tick(controller, clock) == [None]
+
+    metrics.set_fleet(2, cpu_load=0.1)
+    assert tick(controller, clock) == [None]
+    assert deployer.calls == []
+
+
+def test_scale_out_step_is_capped_by_max_nodes(deployer, metrics, clock):
+    controller = make_controller(
+        deployer, metrics, clock, max_nodes=5, scale_out_step=4, breach_periods=1
+    )
+    metrics.set_fleet(3, cpu_load=0.9)
+    assert tick(controller, clock) == [("scale_out", 2)]
+
+
+def test_scale_in_guards_against_projected_load(deployer, metrics, clock):
+    # 2 nodes at 0.2 would leave one node at 0.4, under the scale-out threshold
+    controller = make_controller(
+        deployer, metrics, clock, min_nodes=1, scale_out_cpu=0.35, breach_periods=1
+    )
+    metrics.set_fleet(2, cpu_load=0.2)
+    assert tick(controller, clock) == [None]
+
+    metrics.set_fleet(4, cpu_load=0.2)
+    assert tick(controller, clock) == [("scale_in", "i-0")]
+
+
+def test_unreachable_nodes_count_towards_fleet_size(deployer, metrics, clock):
+    controller = make_controller(
+        deployer, metrics, clock, min_nodes=3, max_nodes=10, breach_periods=1
+    )
+    metrics.set_fleet(10, cpu_load=0.9, unreachable=("i-3", "i-7"))
+    assert tick(controller, clock) == [None]
+
+    metrics.set_fleet(3, cpu_load=0.1, unreachable=("i-1",))
+    assert tick(controller, clock) == [None]
+    assert deployer.calls == []
+
+    # the unreachable node is never picked for retirement
+    controller = make_controller(
+        deployer, metrics, clock, min_nodes=2, breach_periods=1
+    )
+    metrics.set_fleet(3, cpu_load=0.1, unreachable=("i-0",))
+    assert tick(controller, clock) == [("scale_in", "i-1")]
+
+
+def test_projected_load_is_spread_over_the_whole_fleet(deployer, metrics, clock):
+    # 2 reachable nodes at 0.2 out of 4 leave the other 3 at ~0.27 after a retirement
+    controller = make_controller(
+        deployer, metrics, clock, min_nodes=1, scale_out_cpu=0.35, breach_periods=1
+    )
+    metrics.set_fleet(4, cpu_load=0.2, unreachable=("i-2", "i-3"))
+    assert tick(controller, clock) == [("scale_in", "i-0")]
+
+
+def test_no_decision_without_reachable_nodes(deployer, metrics, clock):
+    controller = make_controller(deployer, metrics, clock, breach_periods=1)
+    metrics.set_fleet(0, cpu_load=0.9, unreachable=("i-0", "i-1"))
+    assert tick(controller, clock) == [None]
+
+
+def test_retires_node_holding_fewest_keys(deployer, metrics, clock):
+    controller = make_controller(deployer, metrics, clock, breach_periods=1)
+    metrics.set_fleet(4, cpu_load=0.1)
+    metrics.metrics["i-2"]["keys_in_memory"] = 1
+
+    assert tick(controller, clock) == [("scale_in", "i-2")]
+    assert deployer.calls == [("retire", "i-2", "10.0.0.2")]
+
+
+def test_dry_run_does_not_touch_the_fleet(deployer, metrics, clock):
+    controller = make_controller(deployer, metrics, clock, breach_periods=1)
+    metrics.set_fleet(3, cpu_load=0.9)
+
+    assert tick(controller, clock, dry_run=True) == [("scale_out", 1)]
+    assert deployer.calls == []
+    assert not controller.in_cooldown()
+
+
+def test_failed_action_still_starts_cooldown(metrics, clock):
+    deployer = StubDeployer(fail=True)
+    controller = make_controller(deployer, metrics, clock, breach_periods=1)
+    metrics.set_fleet(3, cpu_load=0.9)
+
+    with pytest.raises(RuntimeError):
+        controller.step()
+    assert controller.in_cooldown()
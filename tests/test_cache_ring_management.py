@@ -0,0 +1,177 @@
+import datetime
+import fnmatch
+
+import pytest
+
+from boto3 import Session
+from moto import mock_aws
+
+import cache_ring_management
+
+from cache_ring_management import CacheRingManager
+from store_layout import all_shards, shard_of
+
+BUCKET = "test-store"
+NODE_IP = "10.0.0.1"
+PEER_IPS = ["10.0.0.2", "10.0.0.3"]
+
+
+class FakeRedis(object):
+    def __init__(self, events):
+        self.values = {}
+        self.events = events
+
+    def set(self, name, value, ex=None):
+        self.values[name] = value
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def keys(self, pattern="*"):
+        return [name for name in self.values if fnmatch.fnmatch(name, pattern)]
+
+    def delete(self, name):
+        self.events.append(("delete", name))
+        self.values.pop(name, None)
+
+
+def heartbeat():
+    return datetime.datetime.utcnow().timestamp()
+
+
+def expires_in(**kwargs):
+    return datetime.datetime.utcnow() + datetime.timedelta(**kwargs)
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def redis_client(events):
+    client = FakeRedis(events)
+    for ip in PEER_IPS:
+        client.set(f"node_{ip}", heartbeat())
+    return client
+
+
+@pytest.fixture
+def manager(aws_credentials, monkeypatch, redis_client, events):
+    monkeypatch.setattr(
+        cache_ring_management.requests,
+        "post",
+        lambda url, **kwargs: events.append(("refresh", url)),
+    )
+    with mock_aws():
+        s3_client = Session(region_name="us-east-1").client("s3")
+        s3_client.create_bucket(Bucket=BUCKET)
+        yield CacheRingManager(
+            ip=NODE_IP,
+            port=5000,
+            redis_client=redis_client,
+            nodes_list_key="nodes",
+            heartbeat_timeout=100,
+            s3_bucket=BUCKET,
+            s3_client=s3_client,
+        )
+
+
+def test_drain_hands_off_before_leaving_the_ring(manager, redis_client, events):
+    keys = [f"key-{i}" for i in range(20)]
+    for key in keys:
+        manager.set_cache_value(key, {"k": key}, expires_in(hours=1), local_only=True)
+    manager.set_cache_value("stale", {"k": 0}, expires_in(hours=-1), local_only=True)
+    events.clear()
+
+    def set_remote_cache(key, value, expiration_date, ip, timeout=None):
+        still_in_ring = f"node_{NODE_IP}" in redis_client.values
+        events.append(("handoff", key, ip, still_in_ring, manager.draining))
+
+    manager._set_remote_cache = set_remote_cache
+    assert manager.drain() == len(keys)
+
+    handoffs = [event for event in events if event[0] == "handoff"]
+    assert {event[1] for event in handoffs} == set(keys)
+    # new owners are the remaining nodes, picked while this node still heartbeats
+    assert {event[2] for event in handoffs} == set(PEER_IPS)
+    assert all(event[3] and not event[4] for event in handoffs)
+
+    assert events[len(handoffs)] == ("delete", f"node_{NODE_IP}")
+    assert sorted(events[len(handoffs) + 1 :]) == sorted(
+        ("refresh", f"http://{ip}:5000/internal/refresh") for ip in PEER_IPS
+    )
+    assert manager.draining
+    manager.set_heartbeat()
+    assert f"node_{NODE_IP}" not in redis_client.values
+
+
+def split_keys(manager):
+    nodes = manager.get_live_nodes()
+    owned, foreign = [], []
+    for key in (f"key-{i}" for i in range(200)):
+        owners = manager.get_nodes_for_key(key, nodes=nodes)
+        (owned if NODE_IP in owners else foreign).append(key)
+    return owned, foreign
+
+
+def test_refresh_keeps_handed_off_keys_of_owned_shards(manager):
+    owned, foreign = split_keys(manager)
+    handed_off, expired = owned[:2]
+
+    manager.set_cache_value(handed_off, {"v": 1}, expires_in(hours=1), local_only=True)
+    manager.set_cache_value(expired, {"v": 1}, expires_in(hours=-1), local_only=True)
+    manager.set_cache_value(foreign[0], {"v": 1}, expires_in(hours=1), local_only=True)
+    manager.refresh_cache()
+
+    assert set(manager.cache_dict) == {handed_off}
+
+
+def owned_shards(manager, primary_only=False):
+    nodes = manager.get_live_nodes()
+    result = set()
+    for shard in all_shards():
+        owners = manager.get_nodes_for_shard(shard, nodes=nodes)
+        if owners[0] == NODE_IP or (not primary_only and NODE_IP in owners):
+            result.add(shard)
+    return result
+
+
+def test_keys_are_routed_by_their_shard(manager):
+    for key in (f"key-{i}" for i in range(50)):
+        assert manager.get_nodes_for_key(key) == manager.get_nodes_for_shard(
+            shard_of(key)
+        )
+
+
+def test_refresh_reads_only_owned_shards(manager):
+    read_shards = []
+    live_keys = manager.store.live_keys
+
+    def record_live_keys(shard):
+        read_shards.append(shard)
+        return live_keys(shard)
+
+    owned, foreign = split_keys(manager)
+    manager.store.put(owned[0], {"v": 1}, expires_in(hours=1))
+    manager.store.put(foreign[0], {"v": 1}, expires_in(hours=1))
+
+    manager.store.live_keys = record_live_keys
+    manager.refresh_cache()
+
+    expected = owned_shards(manager)
+    assert 0 < len(expected) < len(all_shards())
+    assert sorted(read_shards) == sorted(expected)
+    assert set(manager.cache_dict) == {owned[0]}
+
+
+def test_only_the_primary_compacts_a_shard(manager):
+    compacted = []
+    manager.store.compact_shard = lambda shard: compacted.append(shard) or 1
+
+    manager.compact_owned_shards()
+
+    expected = owned_shards(manager, primary_only=True)
+    assert sorted(compacted) == sorted(expected)
+    assert expected < owned_shards(manager)
+    assert manager.stats["compacted_keys"] == len(expected)
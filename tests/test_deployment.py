@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from boto3 import Session
+from moto import mock_aws
+
+from deployment import BOOTSTRAP_USER_DATA, CacheAppDeployer
+
+
+class CallRecorder(object):
+    def __init__(self):
+        self.calls = []
+
+    def attach(self, client, service, operation):
+        client.meta.events.register(
+            f"provide-client-params.{service}.{operation}",
+            lambda params, **kwargs: self.calls.append((operation, dict(params))),
+        )
+
+    def of(self, operation):
+        return [params for name, params in self.calls if name == operation]
+
+
+def add_cache_node_endpoints(parsed, **kwargs):
+    # moto leaves CacheNodes out of describe_cache_clusters
+    for cluster in parsed.get("CacheClusters", []):
+        cluster.setdefault(
+            "CacheNodes",
+            [{"Endpoint": {"Address": f"{cluster['CacheClusterId']}.cache.local"}}],
+        )
+
+
+@pytest.fixture
+def deployer(aws_credentials, tmp_path, monkeypatch):
+    # the key-pair pem file is written to the working dir
+    monkeypatch.chdir(tmp_path)
+    with mock_aws():
+        session = Session(region_name="us-east-1")
+        ami_id = session.client("ec2").describe_images()["Images"][0]["ImageId"]
+        deployer = CacheAppDeployer(
+            base_ec2_image=ami_id, session=session, my_ip="127.0.0.1"
+        )
+        deployer.elasticache_client.meta.events.register(
+            "after-call.elasticache.DescribeCacheClusters", add_cache_node_endpoints
+        )
+        deployer.shell_commands = []
+        deployer._run_shell = deployer.shell_commands.append
+        deployer.recorder = CallRecorder()
+        deployer.recorder.attach(deployer.ec2_client, "ec2", "RunInstances")
+        deployer.recorder.attach(
+            deployer.elb_client, "elastic-load-balancing-v2", "RegisterTargets"
+        )
+        deployer.recorder.attach(
+            deployer.elasticache_client, "elasticache", "DescribeCacheClusters"
+        )
+        deployer.recorder.attach(deployer.s3_client, "s3", "PutObject")
+        yield deployer
+
+
+def test_deploy_app_launches_and_registers_instances_in_one_batch(deployer):
+    deployer.deploy_app(instance_count=3)
+
+    run_calls = deployer.recorder.of("RunInstances")
+    assert len(run_calls) == 1
+    assert run_calls[0]["MinCount"] == run_calls[0]["MaxCount"] == 3
+
+    register_calls = deployer.recorder.of("RegisterTargets")
+    assert len(register_calls) == 1
+    assert len(register_calls[0]["Targets"]) == 3
+
+    # one scp per instance, from a staging dir that's gone once the copy is done
+    scp_commands = [cmd for cmd in deployer.shell_commands if cmd.startswith("scp")]
+    assert len(scp_commands) == 3
+    for cmd in scp_commands:
+        config_file = next(arg for arg in cmd.split() if arg.endswith("CONFIG.txt"))
+        assert not os.path.exists(config_file)
+    assert set(deployer.phase_timings) == {
+        "base_resources",
+        "network",
+        "redis_and_instances",
+        "bootstrap",
+        "register_targets",
+        "launch_to_healthy",
+    }
+
+
+def test_add_instances_to_existing_deployment(deployer):
+    deployer.deploy_app(instance_count=1)
+    deployer.recorder.calls.clear()
+    deployer.phase_timings.clear()
+
+    added = deployer.add_instances_to_existing_deployment(count=4)
+
+    assert len(added) == 4
+    run_calls = deployer.recorder.of("RunInstances")
+    assert len(run_calls) == 1
+    assert run_calls[0]["MinCount"] == run_calls[0]["MaxCount"] == 4
+
+    register_calls = deployer.recorder.of("RegisterTargets")
+    assert len(register_calls) == 1
+    assert {target["Id"] for target in register_calls[0]["Targets"]} == {
+        instance_id for instance_id, _ in added
+    }
+    assert set(deployer.phase_timings) == {
+        "lookup",
+        "launch_instances",
+        "bootstrap",
+        "register_targets",
+        "launch_to_healthy",
+    }
+
+
+def test_deploy_app_with_user_data_bootstrap(deployer, tmp_path):
+    bundle = tmp_path / "bundle.tar.gz"
+    bundle.write_bytes(b"bundle")
+    deployer.build_bundle = lambda work_dir: str(bundle)
+    deployer.bootstrap_mode = BOOTSTRAP_USER_DATA
+
+    deployer.deploy_app(instance_count=2)
+
+    assert deployer.shell_commands == []
+    run_calls = deployer.recorder.of("RunInstances")
+    assert len(run_calls) == 1
+    user_data = run_calls[0]["UserData"]
+    assert f"/{deployer.bundle_key}?" in user_data
+    assert f"/{deployer.node_config_key}?" in user_data
+
+    # the config holds AWS credentials and is gone once the nodes are healthy
+    s3_objects = deployer.s3_client.list_objects_v2(Bucket=deployer.bucket_name)
+    assert {record["Key"] for record in s3_objects["Contents"]} == {deployer.bundle_key}
+
+    # the node config carries the redis address, so it can only go up after redis
+    operations = [
+        name if name != "PutObject" else params["Key"]
+        for name, params in deployer.recorder.calls
+    ]
+    assert operations.index(deployer.node_config_key) > operations.index(
+        "DescribeCacheClusters"
+    )
+    assert "launch_to_healthy" in deployer.phase_timings
@@ -0,0 +1,163 @@
+import datetime
+import json
+
+import pytest
+
+from boto3 import Session
+from moto import mock_aws
+
+from store_layout import ShardedStore, all_shards, shard_of
+
+BUCKET = "test-store"
+
+
+@pytest.fixture
+def s3_client(aws_credentials):
+    with mock_aws():
+        client = Session(region_name="us-east-1").client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def store(s3_client):
+    return ShardedStore(s3_client=s3_client, bucket=BUCKET)
+
+
+def expires_in(**kwargs):
+    return datetime.datetime.utcnow() + datetime.timedelta(**kwargs)
+
+
+def keys_in_shard(count):
+    shard = shard_of("key-0")
+    keys = [key for key in (f"key-{i}" for i in range(5000)) if shard_of(key) == shard]
+    return shard, keys[:count]
+
+
+def bucket_keys(s3_client, prefix=""):
+    response = s3_client.list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return {record["Key"] for record in response.get("Contents", [])}
+
+
+def test_live_keys_merges_manifest_and_pending_markers(store):
+    shard, (compacted, rewritten, pending, expired) = keys_in_shard(4)
+    store.put(compacted, {"v": 1}, expires_in(hours=1))
+    store.put(rewritten, {"v": 1}, expires_in(seconds=-10))
+    store.compact_shard(shard)
+
+    store.put(rewritten, {"v": 2}, expires_in(hours=1))
+    store.put(pending, {"v": 1}, expires_in(hours=1))
+    store.put(expired, {"v": 1}, expires_in(hours=-1))
+
+    store.stats.clear()
+    assert sorted(store.live_keys(shard)) == sorted([compacted, rewritten, pending])
+    # one manifest GET, no object GETs
+    assert store.stats["s3_get_requests"] == 1
+    assert store.get(rewritten)[0] == {"v": 2}
+
+
+def test_compact_shard_folds_markers_and_deletes_expired_objects(store, s3_client):
+    shard, (live, expired) = keys_in_shard(2)
+    store.put(live, {"v": 1}, expires_in(hours=1))
+    store.put(expired, {"v": 1}, expires_in(hours=-1))
+
+    assert store.compact_shard(shard) == 1
+
+    assert bucket_keys(s3_client, prefix="pending/") == set()
+    assert bucket_keys(s3_client, prefix="keys/") == {store.object_key(live)}
+    manifest = s3_client.get_object(Bucket=BUCKET, Key=store.manifest_key(shard))
+    assert set(json.loads(manifest["Body"].read())) == {live}
+    assert store.live_keys(shard) == [live]
+
+
+def test_compact_shard_backs_off_when_manifest_changed(store, s3_client):
+    shard, (first, second) = keys_in_shard(2)
+    store.put(first, {"v": 1}, expires_in(hours=-1))
+    store.compact_shard(shard)
+    store.put(second, {"v": 1}, expires_in(hours=-1))
+
+    other_node = ShardedStore(s3_client=s3_client, bucket=BUCKET)
+    read_pending = store._read_pending
+
+    def read_pending_then_compact_elsewhere(shard):
+        markers = read_pending(shard)
+        store._read_pending = read_pending
+        other_node.compact_shard(shard)
+        return markers
+
+    store._read_pending = read_pending_then_compact_elsewhere
+    assert store.compact_shard(shard) == 0
+    assert other_node.stats["s3_delete_requests"] >= 1
+
+
+def test_compact_shard_keeps_keys_rewritten_during_compaction(store, s3_client):
+    shard, (key,) = keys_in_shard(1)
+    store.put(key, {"v": 1}, expires_in(hours=-1))
+    read_shard_index = store.read_shard_index
+
+    def read_index_then_rewrite(shard, with_etag=False):
+        result = read_shard_index(shard, with_etag=with_etag)
+        store.put(key, {"v": 2}, expires_in(hours=1))
+        return result
+
+    store.read_shard_index = read_index_then_rewrite
+    assert store.compact_shard(shard) == 0
+    store.read_shard_index = read_shard_index
+
+    assert store.get(key)[0] == {"v": 2}
+    assert store.live_keys(shard) == [key]
+
+
+def test_migrate_flat_layout(store, s3_client):
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key="flat-a",
+        Body=json.dumps({"a": 1}),
+        Expires=expires_in(hours=1),
+    )
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key="flat-b",
+        Body=json.dumps({"b": 1}),
+        Expires=expires_in(hours=1),
+    )
+    s3_client.put_object(Bucket=BUCKET, Key="no-expiry", Body=b"junk")
+    s3_client.put_object(Bucket=BUCKET, Key="_deployment/1/CONFIG.txt", Body=b"config")
+
+    assert store.migrate_flat_layout() == 2
+
+    assert bucket_keys(s3_client, prefix="flat-") == set()
+    assert "_deployment/1/CONFIG.txt" in bucket_keys(s3_client)
+    assert store.get("flat-a")[0] == {"a": 1}
+    live = [key for shard in all_shards() for key in store.live_keys(shard)]
+    assert sorted(live) == ["flat-a", "flat-b"]
+
+
+def test_migrate_flat_layout_drops_expired_keys(store, s3_client):
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key="flat-expired",
+        Body=json.dumps({"a": 1}),
+        Expires=expires_in(hours=-1),
+    )
+
+    assert store.migrate_flat_layout() == 0
+
+    assert bucket_keys(s3_client) == set()
+
+
+def test_migrate_flat_layout_keeps_newer_sharded_keys(store, s3_client):
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key="flat-a",
+        Body=json.dumps({"a": 1}),
+        Expires=expires_in(hours=1),
+    )
+    # written by an upgraded node before the migration got to it
+    store.put("flat-a", {"a": 2}, expires_in(hours=2))
+
+    assert store.migrate_flat_layout() == 0
+
+    assert bucket_keys(s3_client, prefix="flat-") == set()
+    assert store.get("flat-a")[0] == {"a": 2}
+    assert store.live_keys(shard_of("flat-a")) == ["flat-a"]